@@ -10,6 +10,7 @@ import pandas as pd
 import numpy as np
 import plotly.express as px
 import plotly.graph_objects as go
+import plotly.io as pio
 from plotly.subplots import make_subplots
 from datetime import datetime, timedelta
 from io import BytesIO
@@ -30,53 +31,97 @@ st.set_page_config(
 # =============================
 # FUNCIONES DE CARGA DE DATOS
 # =============================
+# Tipos explícitos para las columnas de texto repetido de los CSV (se leen como categorías)
+TIPOS_COLUMNAS = {
+    'nombre_cliente': 'category',
+    'ciudad': 'category',
+    'categoria': 'category',
+    'medio_pago': 'category',
+    'nombre_producto': 'category'
+}
+
+# Enteros compactos para ids y cantidades; se aplican después de convertir los valores inválidos a NaN
+TIPOS_ENTEROS = {
+    'id_cliente': 'int32',
+    'id_venta': 'int32',
+    'id_producto': 'int32',
+    'cantidad': 'int16'
+}
+
+def convertir_enteros(df):
+    """Convierte ids y cantidades a números y los reduce a enteros compactos si no faltan valores"""
+    for col, tipo in TIPOS_ENTEROS.items():
+        if col in df.columns:
+            valores = pd.to_numeric(df[col], errors='coerce')
+            df[col] = valores.astype(tipo) if valores.notna().all() else valores
+    return df
+
+def inicios_de_bloques(claves):
+    """Posiciones donde empieza cada bloque de claves iguales en un arreglo ordenado"""
+    return np.flatnonzero(np.r_[True, claves[1:] != claves[:-1]])
+
 @st.cache_data
 def cargar_datos():
     """Carga y prepara todos los datos necesarios para el dashboard"""
     try:
         # Cargar archivos base
-        df_clientes = pd.read_csv(r"../data/raw/clientes.csv")
-        df_productos = pd.read_csv(r"../data/raw/productos.csv")
-        df_ventas = pd.read_csv(r"../data/raw/ventas.csv")
-        df_detalle = pd.read_csv(r"../data/raw/detalle_ventas.csv")
+        df_clientes = convertir_enteros(pd.read_csv(r"../data/raw/clientes.csv", dtype=TIPOS_COLUMNAS, parse_dates=['fecha_alta']))
+        df_productos = convertir_enteros(pd.read_csv(r"../data/raw/productos.csv", dtype=TIPOS_COLUMNAS))
+        df_ventas = convertir_enteros(pd.read_csv(r"../data/raw/ventas.csv", dtype=TIPOS_COLUMNAS, parse_dates=['fecha']))
+        df_detalle = convertir_enteros(pd.read_csv(r"../data/raw/detalle_ventas.csv", dtype=TIPOS_COLUMNAS))
         
         # Limpieza de datos
-        df_clientes['fecha_alta'] = pd.to_datetime(df_clientes['fecha_alta'])
         df_clientes = df_clientes.drop_duplicates(subset=['id_cliente'], keep='first')
         
-        df_ventas['fecha'] = pd.to_datetime(df_ventas['fecha'])
         df_ventas = df_ventas.drop_duplicates(subset=['id_venta'], keep='first')
         
         df_productos['precio_unitario'] = pd.to_numeric(df_productos['precio_unitario'], errors='coerce')
         df_productos = df_productos.drop_duplicates(subset=['id_producto'], keep='first')
         
         df_detalle['importe'] = pd.to_numeric(df_detalle['importe'], errors='coerce')
-        df_detalle['cantidad'] = pd.to_numeric(df_detalle['cantidad'], errors='coerce')
+        df_detalle = df_detalle.sort_values('id_venta', kind='stable', ignore_index=True)
+        
+        # Tablas indexadas por su llave para unir con join en lugar de merge
+        clientes_por_id = df_clientes.set_index('id_cliente')[['nombre_cliente', 'ciudad']]
+        productos_por_id = df_productos.set_index('id_producto')[['nombre_producto', 'categoria', 'precio_unitario']]
+        detalle_por_venta = df_detalle.set_index('id_venta')[['id_producto', 'importe', 'cantidad']]
         
         # Crear dataframe consolidado - evitar columnas duplicadas
         # Primero eliminar nombre_cliente de df_ventas si existe para evitar duplicados
         ventas_cols = [col for col in df_ventas.columns if col != 'nombre_cliente']
         df_ventas_limpio = df_ventas[ventas_cols]
         
-        df_ventas_clientes = df_ventas_limpio.merge(df_clientes[['id_cliente', 'nombre_cliente', 'ciudad']], on='id_cliente', how='left')
-        df_ventas_detalle = df_ventas_clientes.merge(df_detalle[['id_venta', 'id_producto', 'importe', 'cantidad']], on='id_venta', how='left')
-        df_consolidado = df_ventas_detalle.merge(df_productos[['id_producto', 'nombre_producto', 'categoria', 'precio_unitario']], on='id_producto', how='left')
+        df_consolidado = (
+            df_ventas_limpio
+            .join(clientes_por_id, on='id_cliente')
+            .join(detalle_por_venta, on='id_venta')
+            .join(productos_por_id, on='id_producto')
+        )
+        
+        # Orden cronológico para los filtros (las columnas categóricas ya vienen tipadas desde la lectura)
+        df_consolidado = df_consolidado.sort_values('fecha', kind='stable', ignore_index=True)
+        df_ventas = df_ventas.sort_values('fecha', kind='stable', ignore_index=True)
         
         # Calcular RFM
         snapshot_date = df_ventas['fecha'].max() + pd.Timedelta(days=1)
-        df_rfm_base = df_ventas.merge(
-            df_detalle.groupby('id_venta')['importe'].sum().reset_index().rename(columns={'importe': 'total_venta'}),
-            on='id_venta'
+        ids_venta = df_detalle['id_venta'].to_numpy()
+        inicios_venta = inicios_de_bloques(ids_venta)
+        total_por_venta = pd.Series(
+            np.add.reduceat(df_detalle['importe'].fillna(0).to_numpy(), inicios_venta),
+            index=ids_venta[inicios_venta],
+            name='total_venta'
         )
+        df_rfm_base = df_ventas.join(total_por_venta, on='id_venta', how='inner')
         
         df_rfm = df_rfm_base.groupby('id_cliente').agg(
-            Recencia=('fecha', lambda x: (snapshot_date - x.max()).days),
+            ultima_compra=('fecha', 'max'),
             Frecuencia=('id_venta', 'count'),
             Monetario=('total_venta', 'sum')
         ).reset_index()
+        df_rfm.insert(1, 'Recencia', (snapshot_date - df_rfm.pop('ultima_compra')).dt.days)
         
         # Agregar nombre del cliente al RFM
-        df_rfm = df_rfm.merge(df_clientes[['id_cliente', 'nombre_cliente', 'ciudad']], on='id_cliente', how='left')
+        df_rfm = df_rfm.join(clientes_por_id, on='id_cliente')
         
         return df_consolidado, df_rfm, df_clientes, df_productos, df_ventas, df_detalle
     
@@ -87,271 +132,253 @@ def cargar_datos():
 # =============================
 # FUNCIONES DE ANÁLISIS
 # =============================
+# Las cachés que dependen de los filtros guardan como máximo 8 combinaciones durante una hora,
+# para que la memoria no crezca sin límite al recorrer fechas, ciudades y categorías.
+def filtrar_por_fechas(df, fecha_inicio, fecha_fin):
+    """Recorta un DataFrame ordenado por 'fecha' al rango [fecha_inicio, fecha_fin]"""
+    limite_inferior = np.datetime64(fecha_inicio)
+    limite_superior = np.datetime64(fecha_fin) + np.timedelta64(1, 'D')
+    i0, i1 = df['fecha'].values.searchsorted([limite_inferior, limite_superior])
+    return df.iloc[i0:i1]
+
+@st.cache_data(show_spinner=False, ttl=3600, max_entries=8)
+def filtrar_consolidado(_df_consolidado, fecha_inicio, fecha_fin, ciudad, categoria):
+    """Aplica los filtros del sidebar; el resultado se cachea por combinación de filtros"""
+    df_filtrado = filtrar_por_fechas(_df_consolidado, fecha_inicio, fecha_fin)
+    
+    if ciudad != 'Todas':
+        df_filtrado = df_filtrado[df_filtrado['ciudad'] == ciudad]
+    
+    if categoria != 'Todas':
+        df_filtrado = df_filtrado[df_filtrado['categoria'] == categoria]
+    
+    return df_filtrado
+
 def calcular_metricas_principales(df_consolidado):
     """Calcula las métricas KPI principales basadas en datos filtrados"""
-    ventas_totales = df_consolidado['importe'].sum()
-    num_transacciones = df_consolidado['id_venta'].nunique()
-    num_clientes_activos = df_consolidado['id_cliente'].nunique()
+    importes = df_consolidado['importe'].to_numpy()
+    ventas = df_consolidado['id_venta'].to_numpy()
+    
+    ventas_totales = np.nansum(importes)
+    # El consolidado está ordenado por fecha y las líneas de cada venta quedan contiguas,
+    # así que cada cambio de id_venta marca una transacción nueva
+    num_transacciones = int(ventas.size > 0) + int(np.count_nonzero(ventas[1:] != ventas[:-1]))
+    num_clientes_activos = np.unique(df_consolidado['id_cliente'].to_numpy()).size
     ticket_promedio = ventas_totales / num_transacciones if num_transacciones > 0 else 0
     
     return ventas_totales, num_transacciones, num_clientes_activos, ticket_promedio
 
-def ventas_por_periodo(df_consolidado, periodo='D'):
-    """Agrupa ventas por período temporal"""
-    df_temp = df_consolidado.copy()
-    df_temp['fecha'] = pd.to_datetime(df_temp['fecha'])
-    ventas_periodo = df_temp.groupby(pd.Grouper(key='fecha', freq=periodo))['importe'].sum().reset_index()
+@st.cache_data(show_spinner=False, ttl=3600, max_entries=8)
+def ventas_diarias(_df_consolidado, clave_filtros):
+    """Suma las ventas por día; se calcula una vez por combinación de filtros"""
+    importe_por_fecha = _df_consolidado['importe'].set_axis(_df_consolidado['fecha'])
+    return importe_por_fecha.resample('D').sum()
+
+@st.cache_data(show_spinner=False, ttl=3600, max_entries=8)
+def ventas_por_periodo(_df_consolidado, clave_filtros, periodo='D'):
+    """Agrupa ventas por período temporal a partir de los totales diarios"""
+    ventas_periodo = ventas_diarias(_df_consolidado, clave_filtros).resample(periodo).sum().reset_index()
     return ventas_periodo
 
-def top_productos(df_consolidado, n=10, metrica='importe'):
+@st.cache_data(show_spinner=False, ttl=3600, max_entries=8)
+def ventas_por_producto(_df_consolidado, clave_filtros):
+    """Suma ingresos y unidades por producto; se calcula una vez por combinación de filtros"""
+    return _df_consolidado.groupby('nombre_producto', observed=True, sort=False, as_index=False).agg(
+        importe=('importe', 'sum'),
+        cantidad=('cantidad', 'sum')
+    )
+
+def top_productos(df_consolidado, clave_filtros, n=10, metrica='importe'):
     """Obtiene los top N productos por métrica especificada"""
-    if metrica == 'importe':
-        top = df_consolidado.groupby('nombre_producto')['importe'].sum().nlargest(n).reset_index()
-    else:
-        top = df_consolidado.groupby('nombre_producto')['cantidad'].sum().nlargest(n).reset_index()
+    top = ventas_por_producto(df_consolidado, clave_filtros).nlargest(n, metrica)[['nombre_producto', metrica]]
     return top
 
 def analisis_por_ciudad(df_consolidado):
     """Análisis de ventas por ciudad"""
-    ciudad_stats = df_consolidado.groupby('ciudad').agg({
-        'importe': 'sum',
-        'id_venta': 'count',
-        'cantidad': 'sum'
-    }).reset_index()
-    ciudad_stats.columns = ['ciudad', 'ventas_totales', 'num_transacciones', 'unidades_vendidas']
-    ciudad_stats = ciudad_stats.sort_values('ventas_totales', ascending=False)
+    ciudad_stats = df_consolidado.groupby('ciudad', observed=True, sort=False, as_index=False).agg(
+        ventas_totales=('importe', 'sum'),
+        num_transacciones=('id_venta', 'count'),
+        unidades_vendidas=('cantidad', 'sum')
+    ).sort_values('ventas_totales', ascending=False, ignore_index=True)
+    ciudad_stats['ticket_promedio'] = ciudad_stats['ventas_totales'] / ciudad_stats['num_transacciones']
     return ciudad_stats
 
-def calcular_rfm_filtrado(df_consolidado_filtrado):
-    """Calcula RFM basado en datos filtrados"""
-    if len(df_consolidado_filtrado) == 0:
+@st.cache_data(show_spinner=False, ttl=3600, max_entries=8)
+def calcular_rfm_filtrado(_df_consolidado_filtrado, clave_filtros):
+    """Calcula RFM basado en datos filtrados; se calcula una vez por combinación de filtros"""
+    if len(_df_consolidado_filtrado) == 0:
         return pd.DataFrame()
     
     # Verificar columnas necesarias
     columnas_necesarias = ['fecha', 'id_cliente', 'id_venta', 'importe']
     for col in columnas_necesarias:
-        if col not in df_consolidado_filtrado.columns:
-            st.error(f"Error: Columna '{col}' no encontrada. Columnas disponibles: {df_consolidado_filtrado.columns.tolist()}")
+        if col not in _df_consolidado_filtrado.columns:
+            st.error(f"Error: Columna '{col}' no encontrada. Columnas disponibles: {_df_consolidado_filtrado.columns.tolist()}")
             return pd.DataFrame()
     
     # Verificar si existen nombre_cliente y ciudad
-    if 'nombre_cliente' not in df_consolidado_filtrado.columns or 'ciudad' not in df_consolidado_filtrado.columns:
+    if 'nombre_cliente' not in _df_consolidado_filtrado.columns or 'ciudad' not in _df_consolidado_filtrado.columns:
         st.warning("⚠️ Advertencia: Las columnas 'nombre_cliente' o 'ciudad' no están disponibles en los datos filtrados.")
-        st.info(f"Columnas disponibles: {df_consolidado_filtrado.columns.tolist()}")
+        st.info(f"Columnas disponibles: {_df_consolidado_filtrado.columns.tolist()}")
     
     # Calcular fecha snapshot basada en datos filtrados
-    snapshot_date = df_consolidado_filtrado['fecha'].max() + pd.Timedelta(days=1)
-    
-    # Crear un DataFrame auxiliar con la información única por venta
-    columnas_venta = ['id_venta', 'fecha', 'id_cliente']
-    if 'nombre_cliente' in df_consolidado_filtrado.columns:
-        columnas_venta.append('nombre_cliente')
-    if 'ciudad' in df_consolidado_filtrado.columns:
-        columnas_venta.append('ciudad')
-    
-    df_ventas_unicas = df_consolidado_filtrado[columnas_venta].drop_duplicates(subset=['id_venta'])
-    
-    # Calcular total por venta
-    ventas_totales = df_consolidado_filtrado.groupby('id_venta')['importe'].sum().reset_index()
-    ventas_totales.columns = ['id_venta', 'total_venta']
-    
-    # Unir con información de ventas
-    ventas_completas = df_ventas_unicas.merge(ventas_totales, on='id_venta', how='left')
-    
-    # Preparar agregación para RFM - definir el orden explícitamente
-    agg_dict = {
-        'fecha': ('fecha', lambda x: (snapshot_date - x.max()).days),
-        'id_venta': ('id_venta', 'count'),
-        'total_venta': ('total_venta', 'sum')
-    }
+    snapshot_date = _df_consolidado_filtrado['fecha'].max() + pd.Timedelta(days=1)
+    
+    # Ordenar por cliente y venta: cada cliente queda como un bloque contiguo de filas.
+    # Solo se reordenan las columnas usadas, sin materializar una copia ordenada del DataFrame
+    orden = np.lexsort((_df_consolidado_filtrado['id_venta'].to_numpy(), _df_consolidado_filtrado['id_cliente'].to_numpy()))
+    clientes = _df_consolidado_filtrado['id_cliente'].to_numpy()[orden]
+    ventas = _df_consolidado_filtrado['id_venta'].to_numpy()[orden]
+    fechas = _df_consolidado_filtrado['fecha'].to_numpy()[orden]
+    importes = _df_consolidado_filtrado['importe'].fillna(0).to_numpy()[orden]
+    
+    inicios = inicios_de_bloques(clientes)
+    nueva_venta = np.r_[True, ventas[1:] != ventas[:-1]]
+    
+    # Calcular métricas RFM por cliente en una sola pasada sobre los bloques
+    ultima_compra = np.maximum.reduceat(fechas, inicios)
+    df_rfm = pd.DataFrame({
+        'id_cliente': clientes[inicios],
+        'Recencia': (np.datetime64(snapshot_date) - ultima_compra).astype('timedelta64[D]').astype(np.int64),
+        'Frecuencia': np.add.reduceat(nueva_venta.astype(np.int64), inicios),
+        'Monetario': np.add.reduceat(importes, inicios)
+    })
     
     # Agregar nombre_cliente y ciudad si están disponibles
-    if 'nombre_cliente' in ventas_completas.columns:
-        agg_dict['nombre_cliente'] = ('nombre_cliente', 'first')
-    if 'ciudad' in ventas_completas.columns:
-        agg_dict['ciudad'] = ('ciudad', 'first')
-    
-    # Calcular métricas RFM por cliente
-    df_rfm = ventas_completas.groupby('id_cliente').agg(**agg_dict).reset_index()
-    
-    # Renombrar las columnas de métricas RFM
-    rename_dict = {
-        'fecha': 'Recencia',
-        'id_venta': 'Frecuencia',
-        'total_venta': 'Monetario'
-    }
-    df_rfm = df_rfm.rename(columns=rename_dict)
+    for col in ['nombre_cliente', 'ciudad']:
+        if col in _df_consolidado_filtrado.columns:
+            df_rfm[col] = _df_consolidado_filtrado[col].iloc[orden[inicios]].array
     
     return df_rfm
 
-def segmentacion_rfm(df_rfm):
+@st.cache_data(show_spinner=False, ttl=3600, max_entries=8)
+def segmentacion_rfm(_df_rfm, clave_filtros):
     """Segmenta clientes según RFM en categorías"""
-    if len(df_rfm) == 0:
+    if len(_df_rfm) == 0:
         return pd.DataFrame()
     
-    df_seg = df_rfm.copy()
-    
-    # Calcular cuartiles para segmentación
-    df_seg['R_Score'] = pd.qcut(df_seg['Recencia'], 4, labels=[4, 3, 2, 1], duplicates='drop')
-    df_seg['F_Score'] = pd.qcut(df_seg['Frecuencia'].rank(method='first'), 4, labels=[1, 2, 3, 4], duplicates='drop')
-    df_seg['M_Score'] = pd.qcut(df_seg['Monetario'].rank(method='first'), 4, labels=[1, 2, 3, 4], duplicates='drop')
-    
-    df_seg['RFM_Score'] = (df_seg['R_Score'].astype(int) + df_seg['F_Score'].astype(int) + df_seg['M_Score'].astype(int)) / 3
-    
-    # Definir segmentos
-    def clasificar_cliente(row):
-        score = row['RFM_Score']
-        if score >= 3.5:
-            return "Campeones"
-        elif score >= 3.0:
-            return "Leales"
-        elif score >= 2.5:
-            return "Potenciales"
-        elif score >= 2.0:
-            return "En Riesgo"
-        else:
-            return "Inactivos"
-    
-    df_seg['Segmento'] = df_seg.apply(clasificar_cliente, axis=1)
+    df_seg = _df_rfm.copy()
+    
+    # Calcular cuartiles para segmentación (labels=False devuelve el número de cuartil 0..3)
+    r_score = 4 - pd.qcut(df_seg['Recencia'], 4, labels=False, duplicates='drop').to_numpy(np.int8)
+    f_score = 1 + pd.qcut(df_seg['Frecuencia'].rank(method='first'), 4, labels=False, duplicates='drop').to_numpy(np.int8)
+    m_score = 1 + pd.qcut(df_seg['Monetario'].rank(method='first'), 4, labels=False, duplicates='drop').to_numpy(np.int8)
+    
+    df_seg['R_Score'] = r_score
+    df_seg['F_Score'] = f_score
+    df_seg['M_Score'] = m_score
+    df_seg['RFM_Score'] = (r_score + f_score + m_score) / 3
+    
+    # Definir segmentos: cada umbral de RFM_Score abre el segmento siguiente
+    umbrales = np.array([2.0, 2.5, 3.0, 3.5])
+    segmentos = np.array(["Inactivos", "En Riesgo", "Potenciales", "Leales", "Campeones"])
+    df_seg['Segmento'] = pd.Categorical(segmentos[np.searchsorted(umbrales, df_seg['RFM_Score'].to_numpy(), side='right')])
     return df_seg
 
-# =============================
-# ESTILOS CSS PERSONALIZADOS
-# =============================
-st.markdown("""
-<style>
-    .main-header {
-        font-size: 2.5rem;
-        font-weight: bold;
-        color: #1f77b4;
-        text-align: center;
-        margin-bottom: 30px;
-    }
-    .metric-card {
-        background-color: #f0f2f6;
-        padding: 20px;
-        border-radius: 10px;
-        box-shadow: 0 2px 4px rgba(0,0,0,0.1);
-    }
-    .insight-box {
-        background-color: #f0f8ff;
-        border-left: 5px solid #1f77b4;
-        padding: 20px;
-        margin: 15px 0;
-        border-radius: 8px;
-        color: #1a1a1a;
-        box-shadow: 0 2px 6px rgba(0,0,0,0.1);
-    }
-    .insight-box strong {
-        color: #0d47a1;
-    }
-</style>
-""", unsafe_allow_html=True)
-
-# =============================
-# CARGA DE DATOS
-# =============================
-df_consolidado, df_rfm, df_clientes, df_productos, df_ventas, df_detalle = cargar_datos()
-
-if df_consolidado is None:
-    st.stop()
-
-# =============================
-# SIDEBAR - FILTROS
-# =============================
-st.sidebar.header("Filtros de Análisis")
-
-# Filtro de fechas
-fecha_min = df_consolidado['fecha'].min().date()
-fecha_max = df_consolidado['fecha'].max().date()
-
-fecha_inicio = st.sidebar.date_input("Fecha Inicio", fecha_min, min_value=fecha_min, max_value=fecha_max)
-fecha_fin = st.sidebar.date_input("Fecha Fin", fecha_max, min_value=fecha_min, max_value=fecha_max)
-
-# Filtro de ciudad
-ciudades = ['Todas'] + sorted(df_consolidado['ciudad'].dropna().unique().tolist())
-ciudad_seleccionada = st.sidebar.selectbox("Seleccionar Ciudad", ciudades)
-
-# Filtro de categoría
-categorias = ['Todas'] + sorted(df_consolidado['categoria'].dropna().unique().tolist())
-categoria_seleccionada = st.sidebar.selectbox("Seleccionar Categoría", categorias)
-
-# Aplicar filtros
-df_filtrado = df_consolidado.copy()
-df_filtrado = df_filtrado[(df_filtrado['fecha'].dt.date >= fecha_inicio) & (df_filtrado['fecha'].dt.date <= fecha_fin)]
-
-if ciudad_seleccionada != 'Todas':
-    df_filtrado = df_filtrado[df_filtrado['ciudad'] == ciudad_seleccionada]
-
-if categoria_seleccionada != 'Todas':
-    df_filtrado = df_filtrado[df_filtrado['categoria'] == categoria_seleccionada]
-
-# =============================
-# HEADER PRINCIPAL
-# =============================
-st.markdown('<h1 class="main-header">Dashboard de Análisis de Ventas - Minimarket</h1>', unsafe_allow_html=True)
-st.markdown(f"**Período analizado:** {fecha_inicio.strftime('%d/%m/%Y')} - {fecha_fin.strftime('%d/%m/%Y')}")
-st.markdown("---")
-
-# =============================
-# SECCIÓN 1: MÉTRICAS PRINCIPALES (KPIs)
-# =============================
-st.header("Indicadores Clave de Rendimiento (KPIs)")
-
-ventas_totales, num_transacciones, num_clientes_activos, ticket_promedio = calcular_metricas_principales(df_filtrado)
-
-col1, col2, col3, col4 = st.columns(4)
-
-with col1:
-    st.metric(
-        label="💰 Ventas Totales (ARS)",
-        value=f"${ventas_totales:,.2f}",
-        delta=f"{(ventas_totales/1000):.1f}k"
-    )
-
-with col2:
-    st.metric(
-        label="🛒 Transacciones",
-        value=f"{num_transacciones:,}",
-        delta=f"{num_transacciones} ventas"
-    )
-
-with col3:
-    st.metric(
-        label="👥 Clientes Activos",
-        value=f"{num_clientes_activos}",
-        delta=f"{(num_clientes_activos/df_clientes.shape[0]*100):.1f}% del total"
-    )
-
-with col4:
-    st.metric(
-        label="🎯 Ticket Promedio (ARS)",
-        value=f"${ticket_promedio:,.2f}",
-        delta=f"por transacción"
-    )
+@st.cache_data(show_spinner=False, ttl=3600, max_entries=8)
+def metricas_por_segmento(_df_rfm_seg, clave_filtros):
+    """Promedios RFM, cantidad y porcentaje de clientes por segmento"""
+    segmento_metricas = _df_rfm_seg.groupby('Segmento', observed=True).agg({
+        'Recencia': 'mean',
+        'Frecuencia': 'mean',
+        'Monetario': 'mean',
+        'id_cliente': 'count'
+    }).reset_index()
+    segmento_metricas.columns = ['Segmento', 'Recencia Promedio', 'Frecuencia Promedio', 'Gasto Promedio', 'Cantidad Clientes']
+    
+    # Calcular porcentaje
+    total_clientes = segmento_metricas['Cantidad Clientes'].sum()
+    segmento_metricas['Porcentaje'] = (segmento_metricas['Cantidad Clientes'] / total_clientes * 100)
+    return segmento_metricas
+
+@st.cache_data(show_spinner=False, ttl=3600, max_entries=8)
+def top_clientes_rfm(_df_rfm_seg, clave_filtros, columnas, k=15):
+    """Los k clientes de mayor gasto, ordenados de mayor a menor"""
+    return _df_rfm_seg.nlargest(k, 'Monetario', keep='first')[columnas].reset_index(drop=True)
+
+@st.cache_data(show_spinner=False, ttl=3600, max_entries=8)
+def correlaciones_rfm(_df_rfm, clave_filtros):
+    """Matriz de correlación entre Recencia, Frecuencia y Monetario"""
+    metricas = ['Recencia', 'Frecuencia', 'Monetario']
+    valores = _df_rfm[metricas].to_numpy(dtype=np.float64)
+    return pd.DataFrame(np.corrcoef(valores, rowvar=False), index=metricas, columns=metricas)
+
+# Días y meses en español y en orden; las posiciones coinciden con dayofweek y con month - 1
+DIAS_SEMANA = pd.CategoricalDtype(['Lunes', 'Martes', 'Miércoles', 'Jueves', 'Viernes', 'Sábado', 'Domingo'], ordered=True)
+MESES = pd.CategoricalDtype(['Enero', 'Febrero', 'Marzo', 'Abril', 'Mayo', 'Junio', 'Julio', 'Agosto',
+                             'Septiembre', 'Octubre', 'Noviembre', 'Diciembre'], ordered=True)
+
+@st.cache_data(show_spinner=False, ttl=3600, max_entries=8)
+def caracteristicas_fecha(_df_consolidado, clave_filtros):
+    """Columnas de fecha derivadas para el análisis temporal, calculadas una sola vez"""
+    fechas = _df_consolidado['fecha'].dt
+    return pd.DataFrame({
+        'importe': _df_consolidado['importe'],
+        'categoria': _df_consolidado['categoria'],
+        'mes': _df_consolidado['fecha'].to_numpy().astype('datetime64[M]'),
+        'dia_semana_esp': pd.Categorical.from_codes(fechas.dayofweek, dtype=DIAS_SEMANA),
+        'mes_nombre': pd.Categorical.from_codes(fechas.month - 1, dtype=MESES),
+        'mes_num': fechas.month,
+        'dia': fechas.day
+    })
 
-st.markdown("---")
+@st.cache_data(show_spinner=False, ttl=3600, max_entries=8)
+def ventas_mes_dia(_df_consolidado, clave_filtros):
+    """Tabla de ventas por mes (filas) y día del mes (columnas), con ceros donde no hubo ventas"""
+    df_fechas = caracteristicas_fecha(_df_consolidado, clave_filtros)
+    return df_fechas.pivot_table(index='mes_num', columns='dia', values='importe', aggfunc='sum', fill_value=0)
+
+@st.cache_data(show_spinner=False, ttl=3600, max_entries=8)
+def tendencias_por_categoria(_df_consolidado, clave_filtros):
+    """Ventas por mes y categoría junto con el crecimiento de cada categoría entre mitades del período"""
+    df_tiempo_cat = caracteristicas_fecha(_df_consolidado, clave_filtros)
+    ventas_mes_cat = df_tiempo_cat.groupby(['mes', 'categoria'], observed=True)['importe'].sum().reset_index()
+    
+    # Posición de cada mes dentro de su categoría: la primera mitad de los meses se compara
+    # con la segunda (una categoría con un solo mes queda entera en la primera mitad)
+    codigos = ventas_mes_cat['categoria'].cat.codes.to_numpy()
+    importe = ventas_mes_cat['importe'].to_numpy()
+    n_categorias = len(ventas_mes_cat['categoria'].cat.categories)
+    tamanio = np.bincount(codigos, minlength=n_categorias)
+    
+    orden = np.argsort(codigos, kind='stable')
+    posicion = np.empty(len(codigos), dtype=np.int64)
+    posicion[orden] = np.arange(len(codigos)) - (np.cumsum(tamanio) - tamanio)[codigos[orden]]
+    en_primera_mitad = (posicion < tamanio[codigos] // 2) | (tamanio[codigos] == 1)
+    
+    # Sumas de cada mitad por categoría en una pasada de bincount
+    primera_mitad = np.bincount(codigos, weights=np.where(en_primera_mitad, importe, 0), minlength=n_categorias)
+    segunda_mitad = np.bincount(codigos, weights=np.where(en_primera_mitad, 0, importe), minlength=n_categorias)
+    
+    observadas = tamanio > 0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        variacion = (segunda_mitad - primera_mitad) / np.where(primera_mitad != 0, primera_mitad, np.nan) * 100
+    crecimiento = pd.Series(variacion[observadas], index=ventas_mes_cat['categoria'].cat.categories[observadas])
+    return ventas_mes_cat, crecimiento.sort_values(ascending=False)
 
 # =============================
-# SECCIÓN 2: EVOLUCIÓN TEMPORAL
+# FUNCIONES DE GRÁFICOS
 # =============================
-st.header("Evolución de las ventas")
-
-col1, col2 = st.columns([3, 1])
-
-with col2:
-    periodo = st.radio(
-        "Agrupar por:",
-        ["Día", "Semana", "Mes"],
-        index=1
-    )
-    
-    periodo_map = {"Día": "D", "Semana": "W", "Mes": "M"}
-    freq = periodo_map[periodo]
-
-ventas_tiempo = ventas_por_periodo(df_filtrado, freq)
-
-with col1:
+# Cada constructor se cachea según los datos agregados que recibe y devuelve la figura
+# serializada, de modo que un rerun sin cambios no vuelve a armar la figura.
+
+# Serializar con orjson; los arreglos NumPy/pandas viajan al navegador como typed arrays en base64
+pio.json.config.default_engine = 'orjson'
+
+# Plantilla con la paleta de los segmentos RFM, registrada una sola vez al cargar el módulo
+pio.templates['segmentos_rfm'] = go.layout.Template(layout=dict(
+    colorway=px.colors.qualitative.Bold,
+    piecolorway=px.colors.qualitative.Bold
+))
+PLANTILLA_SEGMENTOS = 'plotly+segmentos_rfm'
+
+def mostrar_grafico(figura_json):
+    """Renderiza una figura serializada por los constructores cacheados"""
+    st.plotly_chart(pio.from_json(figura_json), width='stretch')
+
+@st.cache_data(show_spinner=False, ttl=3600, max_entries=8)
+def grafico_evolucion_ventas(ventas_tiempo, periodo):
+    """Línea de ventas por período con su promedio"""
     fig_tiempo = go.Figure()
     
     fig_tiempo.add_trace(go.Scatter(
@@ -382,52 +409,11 @@ with col1:
         height=400,
         hovermode='x unified'
     )
-    
-    st.plotly_chart(fig_tiempo, width='stretch')
+    return fig_tiempo.to_json()
 
-# Insights automáticos
-if len(ventas_tiempo) > 0:
-    mejor_periodo = ventas_tiempo.loc[ventas_tiempo['importe'].idxmax()]
-    peor_periodo = ventas_tiempo.loc[ventas_tiempo['importe'].idxmin()]
-
-    st.markdown(f"""
-    <div class="insight-box">
-        <strong>💡 Insights:</strong><br>
-        • Mejor {periodo.lower()}: {mejor_periodo['fecha'].strftime('%d/%m/%Y')} con ARS ${mejor_periodo['importe']:,.2f}<br>
-        • Menor {periodo.lower()}: {peor_periodo['fecha'].strftime('%d/%m/%Y')} con ARS ${peor_periodo['importe']:,.2f}<br>
-    </div>
-    """, unsafe_allow_html=True)
-
-st.markdown("---")
-
-# =============================
-# SECCIÓN 3: ANÁLISIS POR CIUDAD
-# =============================
-col_header1, col_header2 = st.columns([10, 1])
-with col_header1:
-    st.header("Análisis por Ciudad")
-with col_header2:
-    st.markdown("")  # Espaciado
-    with st.popover("ℹ️"):
-        st.markdown("""
-        **Análisis por ciudad**
-        
-        Compara el rendimiento de ventas entre ciudades:
-        - **Ventas Totales**: Ingresos por ubicación
-        - **Transacciones**: Número de compras
-        - **Ticket Promedio**: Gasto promedio por compra
-        
-        Identifica:
-        - Ciudades con mejor desempeño
-        - Oportunidades de crecimiento
-        - Diferencias en comportamiento de compra
-        """)
-
-ciudad_stats = analisis_por_ciudad(df_filtrado)
-
-col1, col2 = st.columns(2)
-
-with col1:
+@st.cache_data(show_spinner=False, ttl=3600, max_entries=8)
+def grafico_ventas_ciudad(ciudad_stats):
+    """Barras de ventas totales por ciudad"""
     fig_ciudad_ventas = px.bar(
         ciudad_stats,
         x='ciudad',
@@ -440,9 +426,11 @@ with col1:
     )
     fig_ciudad_ventas.update_traces(texttemplate='$%{text:,.0f}', textposition='inside')
     fig_ciudad_ventas.update_layout(height=400, showlegend=False)
-    st.plotly_chart(fig_ciudad_ventas, width='stretch')
+    return fig_ciudad_ventas.to_json()
 
-with col2:
+@st.cache_data(show_spinner=False, ttl=3600, max_entries=8)
+def grafico_transacciones_ciudad(ciudad_stats):
+    """Dona con la distribución de transacciones por ciudad"""
     fig_ciudad_trans = px.pie(
         ciudad_stats,
         values='num_transacciones',
@@ -453,37 +441,11 @@ with col2:
     )
     fig_ciudad_trans.update_traces(textposition='inside', textinfo='percent+label')
     fig_ciudad_trans.update_layout(height=400)
-    st.plotly_chart(fig_ciudad_trans, width='stretch')
-
-# Tabla resumen
-ciudad_stats_display = ciudad_stats.copy()
-ciudad_stats_display['ventas_totales'] = ciudad_stats_display['ventas_totales'].apply(lambda x: f"ARS ${x:,.2f}")
-ciudad_stats_display['ticket_promedio'] = (ciudad_stats['ventas_totales'] / ciudad_stats['num_transacciones']).apply(lambda x: f"ARS ${x:,.2f}")
-ciudad_stats_display.columns = ['Ciudad', 'Ventas Totales', 'Transacciones', 'Unidades Vendidas', 'Ticket Promedio']
-st.dataframe(ciudad_stats_display, width='stretch', hide_index=True)
-
-st.markdown("---")
-
-# =============================
-# SECCIÓN 4: ANÁLISIS DE PRODUCTOS
-# =============================
-st.header("Análisis de Productos")
+    return fig_ciudad_trans.to_json()
 
-col1, col2 = st.columns(2)
-
-with col1:
-    n_productos = st.slider("Top N Productos:", 5, 20, 10)
-
-with col2:
-    metrica_prod = st.selectbox("Ordenar por:", ["Ingresos", "Cantidad Vendida"])
-
-metrica = 'importe' if metrica_prod == "Ingresos" else 'cantidad'
-top_prods = top_productos(df_filtrado, n=n_productos, metrica=metrica)
-
-# Mostrar gráficos de productos en dos columnas
-col1, col2 = st.columns(2)
-
-with col1:
+@st.cache_data(show_spinner=False, ttl=3600, max_entries=8)
+def grafico_top_productos(top_prods, metrica, metrica_prod, n_productos):
+    """Barras horizontales con los productos top"""
     fig_productos = px.bar(
         top_prods,
         y='nombre_producto',
@@ -495,37 +457,24 @@ with col1:
         color_continuous_scale='Viridis',
         text=metrica
     )
-
+    
     if metrica == 'importe':
         fig_productos.update_traces(texttemplate='$%{text:,.0f}', textposition='inside')
     else:
         fig_productos.update_traces(texttemplate='%{text:,.0f} unid.', textposition='inside')
-
+    
     fig_productos.update_layout(height=500, showlegend=False, yaxis={'categoryorder':'total ascending'})
-    st.plotly_chart(fig_productos, width='stretch')
+    return fig_productos.to_json()
 
-with col2:
-    # Distribución por categoría con información detallada en hover
-    categoria_stats = df_filtrado.groupby('categoria').agg({
-        'importe': 'sum',
-        'id_venta': 'nunique'
-    }).reset_index()
-    categoria_stats.columns = ['categoria', 'ventas_totales', 'num_transacciones']
-    categoria_stats = categoria_stats.sort_values('ventas_totales', ascending=False)
-    
-    # Calcular métricas adicionales para el hover
-    categoria_stats['ticket_promedio'] = categoria_stats['ventas_totales'] / categoria_stats['num_transacciones']
-    categoria_stats['porcentaje'] = (categoria_stats['ventas_totales'] / categoria_stats['ventas_totales'].sum() * 100)
-    
+@st.cache_data(show_spinner=False, ttl=3600, max_entries=8)
+def grafico_categorias(categoria_stats):
+    """Torta de ventas por categoría con información detallada en hover"""
     # Crear texto de hover personalizado
-    hover_text = []
-    for _, row in categoria_stats.iterrows():
-        text = (f"<b>{row['categoria']}</b><br><br>"
-                f"<b>Ventas Totales:</b> ARS ${row['ventas_totales']:,.2f}<br>"
-                f"<b>Porcentaje:</b> {row['porcentaje']:.1f}%<br>"
-                f"<b>Transacciones:</b> {row['num_transacciones']:,.0f}<br>"
-                f"<b>Ticket Promedio:</b> ARS ${row['ticket_promedio']:,.2f}")
-        hover_text.append(text)
+    hover_text = ("<b>" + categoria_stats['categoria'].astype(str) + "</b><br><br>"
+                  + "<b>Ventas Totales:</b> ARS $" + categoria_stats['ventas_totales'].map('{:,.2f}'.format) + "<br>"
+                  + "<b>Porcentaje:</b> " + categoria_stats['porcentaje'].map('{:.1f}'.format) + "%<br>"
+                  + "<b>Transacciones:</b> " + categoria_stats['num_transacciones'].map('{:,.0f}'.format) + "<br>"
+                  + "<b>Ticket Promedio:</b> ARS $" + categoria_stats['ticket_promedio'].map('{:,.2f}'.format)).tolist()
     
     # Usar go.Pie para mejor control
     fig_cat_pie = go.Figure(data=[go.Pie(
@@ -542,26 +491,11 @@ with col2:
         title='Distribución de Ventas por Categoría',
         height=500
     )
-    st.plotly_chart(fig_cat_pie, width='stretch')
-
-st.markdown("---")
-
-# =============================
-# SECCIÓN 5: ANÁLISIS DE MÉTODOS DE PAGO
-# =============================
-st.header("Análisis de Métodos de Pago")
-
-df_ventas_filtradas = df_ventas[
-    (df_ventas['fecha'].dt.date >= fecha_inicio) & 
-    (df_ventas['fecha'].dt.date <= fecha_fin)
-]
-
-metodo_pago_stats = df_ventas_filtradas['medio_pago'].value_counts().reset_index()
-metodo_pago_stats.columns = ['medio_pago', 'cantidad']
-
-col1, col2 = st.columns(2)
+    return fig_cat_pie.to_json()
 
-with col1:
+@st.cache_data(show_spinner=False, ttl=3600, max_entries=8)
+def grafico_metodos_pago(metodo_pago_stats):
+    """Barras con la frecuencia de cada método de pago"""
     fig_pago = px.bar(
         metodo_pago_stats,
         x='medio_pago',
@@ -574,15 +508,11 @@ with col1:
     )
     fig_pago.update_traces(textposition='inside')
     fig_pago.update_layout(height=400, showlegend=False)
-    st.plotly_chart(fig_pago, width='stretch')
+    return fig_pago.to_json()
 
-with col2:
-    # Método de pago por ciudad (top 3 ciudades)
-    top_3_ciudades = ciudad_stats.head(3)['ciudad'].tolist()
-    df_pago_ciudad = df_filtrado[df_filtrado['ciudad'].isin(top_3_ciudades)]
-    
-    pago_ciudad_stats = df_pago_ciudad.groupby(['ciudad', 'medio_pago']).size().reset_index(name='count')
-    
+@st.cache_data(show_spinner=False, ttl=3600, max_entries=8)
+def grafico_pago_ciudad(pago_ciudad_stats):
+    """Barras agrupadas de métodos de pago por ciudad"""
     fig_pago_ciudad = px.bar(
         pago_ciudad_stats,
         x='ciudad',
@@ -593,416 +523,685 @@ with col2:
         barmode='group'
     )
     fig_pago_ciudad.update_layout(height=400)
-    st.plotly_chart(fig_pago_ciudad, width='stretch')
+    return fig_pago_ciudad.to_json()
 
-st.markdown("---")
+@st.cache_data(show_spinner=False, ttl=3600, max_entries=8)
+def grafico_segmentos(segmento_metricas):
+    """Dona de segmentos RFM; el detalle del hover lo formatea Plotly desde customdata"""
+    fig_seg_pie = go.Figure(data=[go.Pie(
+        labels=segmento_metricas['Segmento'],
+        values=segmento_metricas['Cantidad Clientes'],
+        customdata=segmento_metricas[['Cantidad Clientes', 'Porcentaje', 'Recencia Promedio', 'Frecuencia Promedio', 'Gasto Promedio']].to_numpy(),
+        hovertemplate=("<b>%{label}</b><br><br>"
+                       "<b>Cantidad de Clientes:</b> %{customdata[0]:,.0f}<br>"
+                       "<b>Porcentaje:</b> %{customdata[1]:.1f}%<br><br>"
+                       "<b>Recencia Promedio:</b> %{customdata[2]:.0f} días<br>"
+                       "<b>Frecuencia Promedio:</b> %{customdata[3]:.1f} compras<br>"
+                       "<b>Gasto Promedio:</b> ARS $%{customdata[4]:,.2f}<extra></extra>"),
+        textposition='inside',
+        textinfo='label+percent',
+        hole=0.4
+    )])
+    
+    fig_seg_pie.update_layout(
+        title='Distribución de Segmentos de Clientes',
+        height=450,
+        template=PLANTILLA_SEGMENTOS
+    )
+    return fig_seg_pie.to_json()
+
+def muestra_por_segmento(df_rfm_seg, max_puntos=5000):
+    """Muestra estratificada por segmento para graficar, con al menos 50 clientes por segmento"""
+    if len(df_rfm_seg) <= max_puntos:
+        return df_rfm_seg
+    
+    # Cupo proporcional al tamaño de cada segmento y posición aleatoria de cada cliente dentro de él
+    tamanio = df_rfm_seg.groupby('Segmento', observed=True, sort=False)['Segmento'].transform('size')
+    cupo = np.maximum(50, (max_puntos * tamanio // len(df_rfm_seg)).to_numpy())
+    barajado = df_rfm_seg[['Segmento']].sample(frac=1, random_state=0)
+    posicion = barajado.groupby('Segmento', observed=True, sort=False).cumcount().reindex(df_rfm_seg.index).to_numpy()
+    return df_rfm_seg[posicion < cupo]
+
+@st.cache_data(show_spinner=False, ttl=3600, max_entries=8)
+def grafico_dispersion_rfm(_df_rfm_seg, clave_filtros, x, y, tamanio, hover_data, titulo, etiquetas):
+    """Dispersión RFM por segmento; con muchos clientes grafica una muestra sobre la densidad completa"""
+    df_muestra = muestra_por_segmento(_df_rfm_seg)
+    fig_scatter = px.scatter(
+        df_muestra,
+        x=x,
+        y=y,
+        color='Segmento',
+        size=tamanio,
+        hover_data=hover_data if hover_data else None,
+        title=titulo,
+        labels=etiquetas,
+        template=PLANTILLA_SEGMENTOS
+    )
+    
+    # Si se muestreó, la densidad de todos los clientes queda como fondo de los puntos
+    if len(df_muestra) < len(_df_rfm_seg):
+        fig_scatter.add_trace(go.Histogram2dContour(
+            x=_df_rfm_seg[x],
+            y=_df_rfm_seg[y],
+            colorscale='Greys',
+            showscale=False,
+            opacity=0.4,
+            hoverinfo='skip',
+            showlegend=False
+        ))
+        fig_scatter.data = fig_scatter.data[-1:] + fig_scatter.data[:-1]
+    
+    fig_scatter.update_layout(height=500)
+    return fig_scatter.to_json()
+
+@st.cache_data(show_spinner=False, ttl=3600, max_entries=8)
+def grafico_violin_segmentos(segmentos, valores, titulo, titulo_y):
+    """Violines de una métrica RFM, una traza por segmento con la paleta de segmentos"""
+    fig_violin = go.Figure()
+    # Los grupos salen de una sola pasada de groupby, sin filtrar el DataFrame por cada segmento
+    for segmento, valores_segmento in valores.groupby(segmentos, observed=True, sort=False):
+        fig_violin.add_trace(go.Violin(
+            y=valores_segmento.to_numpy(),
+            name=str(segmento),
+            box_visible=True,
+            meanline_visible=False,
+            points='outliers',
+            pointpos=0,
+            hoverinfo='y'
+        ))
+    
+    fig_violin.update_layout(
+        title=titulo,
+        xaxis_title='Segmento',
+        yaxis_title=titulo_y,
+        height=450,
+        showlegend=False,
+        xaxis={'tickangle': 0},
+        template=PLANTILLA_SEGMENTOS
+    )
+    return fig_violin.to_json()
 
 # =============================
-# SECCIÓN 6: SEGMENTACIÓN RFM
+# FUNCIONES DE EXPORTACIÓN
 # =============================
-col_header1, col_header2 = st.columns([10, 1])
-with col_header1:
-    st.header("Análisis RFM")
-with col_header2:
-    st.markdown("")  # Espaciado
-    with st.popover("ℹ️"):
-        st.markdown("""
-        **¿Qué es RFM?**
-        
-        **Recency (Recencia)**: Días desde la última compra
-        - ✅ Menor = Mejor (compró recientemente)
-        - ❌ Mayor = Peor (hace tiempo que no compra)
-        
-        **Frequency (Frecuencia)**: Número de compras
-        - ✅ Mayor = Mejor (cliente frecuente)
-        - ❌ Menor = Peor (compra poco)
-        
-        **Monetary (Monetario)**: Gasto total
-        - ✅ Mayor = Mejor (cliente valioso)
-        - ❌ Menor = Peor (gasta poco)
-        
-        **Segmentos de clientes:**
-        - **Campeones**: Los mejores clientes
-        - **Leales**: Clientes constantes
-        - **Potenciales**: Pueden mejorar
-        - **En Riesgo**: Requieren atención
-        - **Inactivos**: No compran hace tiempo
-        """)
+# Los archivos se generan una vez por tabla y combinación de filtros; los reruns reutilizan los bytes.
+@st.cache_data(show_spinner=False, max_entries=6)
+def exportar_csv(_df, clave_exportacion):
+    """Serializa la tabla a CSV en UTF-8"""
+    return _df.to_csv(index=False).encode('utf-8')
+
+@st.cache_data(show_spinner=False, max_entries=6)
+def exportar_excel(_df, clave_exportacion):
+    """Serializa la tabla a Excel con xlsxwriter"""
+    output = BytesIO()
+    # Sin constant_memory: pandas escribe columna por columna y ese modo descarta las celdas
+    with pd.ExcelWriter(output, engine='xlsxwriter',
+                        engine_kwargs={'options': {'strings_to_urls': False}}) as writer:
+        _df.to_excel(writer, index=False, sheet_name='Datos')
+    return output.getvalue()
 
-# Calcular RFM basado en datos filtrados
-df_rfm_filtrado = calcular_rfm_filtrado(df_filtrado)
+# =============================
+# ESTILOS CSS PERSONALIZADOS
+# =============================
+st.markdown("""
+<style>
+    .main-header {
+        font-size: 2.5rem;
+        font-weight: bold;
+        color: #1f77b4;
+        text-align: center;
+        margin-bottom: 30px;
+    }
+    .metric-card {
+        background-color: #f0f2f6;
+        padding: 20px;
+        border-radius: 10px;
+        box-shadow: 0 2px 4px rgba(0,0,0,0.1);
+    }
+    .insight-box {
+        background-color: #f0f8ff;
+        border-left: 5px solid #1f77b4;
+        padding: 20px;
+        margin: 15px 0;
+        border-radius: 8px;
+        color: #1a1a1a;
+        box-shadow: 0 2px 6px rgba(0,0,0,0.1);
+    }
+    .insight-box strong {
+        color: #0d47a1;
+    }
+</style>
+""", unsafe_allow_html=True)
 
-# Validar que hay datos
-if len(df_rfm_filtrado) == 0:
-    st.warning("⚠️ No hay datos suficientes para calcular el análisis RFM con los filtros aplicados.")
-else:
-    df_rfm_seg = segmentacion_rfm(df_rfm_filtrado)
-    
-    # KPIs RFM
-    st.subheader("Métricas generales")
-    col1, col2, col3 = st.columns(3)
+# =============================
+# CARGA DE DATOS
+# =============================
+df_consolidado, df_rfm, df_clientes, df_productos, df_ventas, df_detalle = cargar_datos()
+
+if df_consolidado is None:
+    st.stop()
+
+# =============================
+# SIDEBAR - FILTROS
+# =============================
+st.sidebar.header("Filtros de Análisis")
+
+# Filtro de fechas
+fecha_min = df_consolidado['fecha'].min().date()
+fecha_max = df_consolidado['fecha'].max().date()
+
+fecha_inicio = st.sidebar.date_input("Fecha Inicio", fecha_min, min_value=fecha_min, max_value=fecha_max)
+fecha_fin = st.sidebar.date_input("Fecha Fin", fecha_max, min_value=fecha_min, max_value=fecha_max)
+
+# Filtro de ciudad
+ciudades = ['Todas'] + df_consolidado['ciudad'].cat.categories.tolist()
+ciudad_seleccionada = st.sidebar.selectbox("Seleccionar Ciudad", ciudades)
+
+# Filtro de categoría
+categorias = ['Todas'] + df_consolidado['categoria'].cat.categories.tolist()
+categoria_seleccionada = st.sidebar.selectbox("Seleccionar Categoría", categorias)
+
+# Aplicar filtros
+clave_filtros = (fecha_inicio, fecha_fin, ciudad_seleccionada, categoria_seleccionada)
+df_filtrado = filtrar_consolidado(df_consolidado, *clave_filtros)
+
+# =============================
+# HEADER PRINCIPAL
+# =============================
+st.markdown('<h1 class="main-header">Dashboard de Análisis de Ventas - Minimarket</h1>', unsafe_allow_html=True)
+st.markdown(f"**Período analizado:** {fecha_inicio.strftime('%d/%m/%Y')} - {fecha_fin.strftime('%d/%m/%Y')}")
+st.markdown("---")
+
+# Sin ventas para los filtros se omiten las secciones que dependen de ellos;
+# la exportación de tablas completas y el clustering se muestran igual
+hay_ventas = len(df_filtrado) > 0
+df_rfm_seg = pd.DataFrame()
+if not hay_ventas:
+    st.warning("⚠️ No hay ventas para los filtros seleccionados. Ajusta el período, la ciudad o la categoría.")
 
+if hay_ventas:
+    # =============================
+    # SECCIÓN 1: MÉTRICAS PRINCIPALES (KPIs)
+    # =============================
+    st.header("Indicadores Clave de Rendimiento (KPIs)")
+    
+    ventas_totales, num_transacciones, num_clientes_activos, ticket_promedio = calcular_metricas_principales(df_filtrado)
+    
+    col1, col2, col3, col4 = st.columns(4)
+    
     with col1:
         st.metric(
-            label="🕐 Recencia Promedio",
-            value=f"{df_rfm_filtrado['Recencia'].mean():.0f} días",
-            delta=f"Min: {df_rfm_filtrado['Recencia'].min()} días",
-            delta_color="inverse"  # Menor es mejor
+            label="💰 Ventas Totales (ARS)",
+            value=f"${ventas_totales:,.2f}",
+            delta=f"{(ventas_totales/1000):.1f}k"
         )
-
+    
     with col2:
         st.metric(
-            label="🔄 Frecuencia Promedio",
-            value=f"{df_rfm_filtrado['Frecuencia'].mean():.1f} compras",
-            delta=f"Max: {df_rfm_filtrado['Frecuencia'].max()} compras"
+            label="🛒 Transacciones",
+            value=f"{num_transacciones:,}",
+            delta=f"{num_transacciones} ventas"
         )
-
+    
     with col3:
         st.metric(
-            label="💰 Gasto Promedio",
-            value=f"ARS ${df_rfm_filtrado['Monetario'].mean():,.2f}",
-            delta=f"Total: ARS ${df_rfm_filtrado['Monetario'].sum():,.0f}"
+            label="👥 Clientes Activos",
+            value=f"{num_clientes_activos}",
+            delta=f"{(num_clientes_activos/df_clientes.shape[0]*100):.1f}% del total"
         )
-
     
-    # Calcular métricas por segmento
-    segmento_metricas = df_rfm_seg.groupby('Segmento').agg({
-        'Recencia': 'mean',
-        'Frecuencia': 'mean',
-        'Monetario': 'mean',
-        'id_cliente': 'count'
-    }).reset_index()
-    segmento_metricas.columns = ['Segmento', 'Recencia Promedio', 'Frecuencia Promedio', 'Gasto Promedio', 'Cantidad Clientes']
+    with col4:
+        st.metric(
+            label="🎯 Ticket Promedio (ARS)",
+            value=f"${ticket_promedio:,.2f}",
+            delta=f"por transacción"
+        )
     
-    # Calcular porcentaje
-    total_clientes = segmento_metricas['Cantidad Clientes'].sum()
-    segmento_metricas['Porcentaje'] = (segmento_metricas['Cantidad Clientes'] / total_clientes * 100)
+    st.markdown("---")
     
-    # Crear texto de hover personalizado
-    hover_text = []
-    for _, row in segmento_metricas.iterrows():
-        text = (f"<b>{row['Segmento']}</b><br><br>"
-                f"<b>Cantidad de Clientes:</b> {row['Cantidad Clientes']:,.0f}<br>"
-                f"<b>Porcentaje:</b> {row['Porcentaje']:.1f}%<br><br>"
-                f"<b>Recencia Promedio:</b> {row['Recencia Promedio']:.0f} días<br>"
-                f"<b>Frecuencia Promedio:</b> {row['Frecuencia Promedio']:.1f} compras<br>"
-                f"<b>Gasto Promedio:</b> ARS ${row['Gasto Promedio']:,.2f}")
-        hover_text.append(text)
-    
-    # Gráfico de pie con información completa
-    fig_seg_pie = go.Figure(data=[go.Pie(
-        labels=segmento_metricas['Segmento'],
-        values=segmento_metricas['Cantidad Clientes'],
-        hovertext=hover_text,
-        hoverinfo='text',
-        textposition='inside',
-        textinfo='label+percent',
-        marker=dict(colors=px.colors.qualitative.Bold),
-        hole=0.4
-    )])
+    # =============================
+    # SECCIÓN 2: EVOLUCIÓN TEMPORAL
+    # =============================
+    st.header("Evolución de las ventas")
     
-    fig_seg_pie.update_layout(
-        title='Distribución de Segmentos de Clientes',
-        height=450
-    )
-    st.plotly_chart(fig_seg_pie, width='stretch')
-    
-    # Tabla detallada de segmentos
-    segmento_metricas_display = segmento_metricas.copy()
-    segmento_metricas_display['Recencia Promedio'] = segmento_metricas_display['Recencia Promedio'].apply(lambda x: f"{x:.0f} días")
-    segmento_metricas_display['Frecuencia Promedio'] = segmento_metricas_display['Frecuencia Promedio'].apply(lambda x: f"{x:.1f} compras")
-    segmento_metricas_display['Gasto Promedio'] = segmento_metricas_display['Gasto Promedio'].apply(lambda x: f"ARS ${x:,.2f}")
-    segmento_metricas_display['Porcentaje'] = segmento_metricas_display['Porcentaje'].apply(lambda x: f"{x:.1f}%")
-    segmento_metricas_display = segmento_metricas_display[['Segmento', 'Cantidad Clientes', 'Porcentaje', 'Recencia Promedio', 'Frecuencia Promedio', 'Gasto Promedio']]
-    st.dataframe(segmento_metricas_display, width='stretch', hide_index=True)
-
-    # Gráficos de distribución RFM - Box plots con violin para mejor visualización
+    col1, col2 = st.columns([3, 1])
+    
+    with col2:
+        periodo = st.radio(
+            "Agrupar por:",
+            ["Día", "Semana", "Mes"],
+            index=1
+        )
+    
+        periodo_map = {"Día": "D", "Semana": "W", "Mes": "M"}
+        freq = periodo_map[periodo]
+    
+    ventas_tiempo = ventas_por_periodo(df_filtrado, clave_filtros, freq)
+    
+    with col1:
+        mostrar_grafico(grafico_evolucion_ventas(ventas_tiempo, periodo))
+    
+    # Insights automáticos
+    if len(ventas_tiempo) > 0:
+        mejor_periodo = ventas_tiempo.loc[ventas_tiempo['importe'].idxmax()]
+        peor_periodo = ventas_tiempo.loc[ventas_tiempo['importe'].idxmin()]
+    
+        st.markdown(f"""
+        <div class="insight-box">
+            <strong>💡 Insights:</strong><br>
+            • Mejor {periodo.lower()}: {mejor_periodo['fecha'].strftime('%d/%m/%Y')} con ARS ${mejor_periodo['importe']:,.2f}<br>
+            • Menor {periodo.lower()}: {peor_periodo['fecha'].strftime('%d/%m/%Y')} con ARS ${peor_periodo['importe']:,.2f}<br>
+        </div>
+        """, unsafe_allow_html=True)
+    
+    st.markdown("---")
+    
+    # =============================
+    # SECCIÓN 3: ANÁLISIS POR CIUDAD
+    # =============================
     col_header1, col_header2 = st.columns([10, 1])
     with col_header1:
-        st.subheader("Distribuciones de métricas RFM por Segmento")
+        st.header("Análisis por Ciudad")
     with col_header2:
         st.markdown("")  # Espaciado
         with st.popover("ℹ️"):
             st.markdown("""
-            **¿Cómo leer estos gráficos?**
-            
-            Cada figura combina dos visualizaciones:
-            
-            **Forma de violín:**
-            - Muestra la distribución completa de los datos
-            - La parte más ancha indica mayor concentración de clientes
-            - Te permite ver la "forma" de tus datos
-            
-            **Box plot interno (caja):**
-            - La línea central es la **mediana** (50% de los datos)
-            - Los bordes de la caja son **Q1 y Q3** (25% y 75%)
-            - Los bigotes muestran el rango de datos
-            - Los puntos son **outliers** (valores atípicos)
-            
-            Pasa el mouse sobre el gráfico para ver estadísticos detallados.
+            **Análisis por ciudad**
+    
+            Compara el rendimiento de ventas entre ciudades:
+            - **Ventas Totales**: Ingresos por ubicación
+            - **Transacciones**: Número de compras
+            - **Ticket Promedio**: Gasto promedio por compra
+    
+            Identifica:
+            - Ciudades con mejor desempeño
+            - Oportunidades de crecimiento
+            - Diferencias en comportamiento de compra
             """)
-
-    col1, col2, col3 = st.columns(3)
-
+    
+    ciudad_stats = analisis_por_ciudad(df_filtrado)
+    
+    col1, col2 = st.columns(2)
+    
     with col1:
-        fig_rec = go.Figure()
-        for segmento in df_rfm_seg['Segmento'].unique():
-            df_seg = df_rfm_seg[df_rfm_seg['Segmento'] == segmento]
-            
-            fig_rec.add_trace(go.Violin(
-                y=df_seg['Recencia'],
-                name=segmento,
-                box_visible=True,
-                meanline_visible=False,
-                points='outliers',
-                pointpos=0,
-                hoverinfo='y'
-            ))
-        
-        fig_rec.update_layout(
-            title='Distribución de Recencia',
-            xaxis_title='Segmento',
-            yaxis_title='Días desde última compra',
-            height=450,
-            showlegend=False,
-            xaxis={'tickangle': 0}
-        )
-        st.plotly_chart(fig_rec, width='stretch')
-
+        mostrar_grafico(grafico_ventas_ciudad(ciudad_stats))
+    
     with col2:
-        fig_freq = go.Figure()
-        for segmento in df_rfm_seg['Segmento'].unique():
-            df_seg = df_rfm_seg[df_rfm_seg['Segmento'] == segmento]
-            
-            fig_freq.add_trace(go.Violin(
-                y=df_seg['Frecuencia'],
-                name=segmento,
-                box_visible=True,
-                meanline_visible=False,
-                points='outliers',
-                pointpos=0,
-                hoverinfo='y'
-            ))
-        
-        fig_freq.update_layout(
-            title='Distribución de Frecuencia',
-            xaxis_title='Segmento',
-            yaxis_title='Número de compras',
-            height=450,
-            showlegend=False,
-            xaxis={'tickangle': 0}
-        )
-        st.plotly_chart(fig_freq, width='stretch')
-
-    with col3:
-        fig_mon = go.Figure()
-        for segmento in df_rfm_seg['Segmento'].unique():
-            df_seg = df_rfm_seg[df_rfm_seg['Segmento'] == segmento]
-            
-            fig_mon.add_trace(go.Violin(
-                y=df_seg['Monetario'],
-                name=segmento,
-                box_visible=True,
-                meanline_visible=False,
-                points='outliers',
-                pointpos=0,
-                hoverinfo='y'
-            ))
-        
-        fig_mon.update_layout(
-            title='Distribución de Gasto',
-            xaxis_title='Segmento',
-            yaxis_title='Gasto Total (ARS)',
-            height=450,
-            showlegend=False,
-            xaxis={'tickangle': 0}
-        )
-        st.plotly_chart(fig_mon, width='stretch')
-
-    # Scatter plots RFM mejorados
-    st.subheader("Análisis de Relaciones entre Métricas RFM")
-
-    tab1, tab2, tab3 = st.tabs(["Frecuencia vs Monetario", "Recencia vs Monetario", "Recencia vs Frecuencia"])
-
-    # Preparar hover_data - incluir nombre_cliente y ciudad si existen
-    hover_base = []
-    if 'nombre_cliente' in df_rfm_seg.columns:
-        hover_base.append('nombre_cliente')
-    if 'ciudad' in df_rfm_seg.columns:
-        hover_base.append('ciudad')
-
-    with tab1:
-        hover_data_tab1 = hover_base + ['Recencia']
-        fig_scatter1 = px.scatter(
-            df_rfm_seg,
-            x='Frecuencia',
-            y='Monetario',
-            color='Segmento',
-            size='Recencia',
-            hover_data=hover_data_tab1 if hover_data_tab1 else None,
-            title='Frecuencia vs Gasto Total (tamaño del punto = días desde última compra)',
-            labels={'Frecuencia': 'Número de Compras', 'Monetario': 'Gasto Total (ARS)'},
-            color_discrete_sequence=px.colors.qualitative.Bold
-        )
-        fig_scatter1.update_layout(height=500)
-        st.plotly_chart(fig_scatter1, width='stretch')
-        st.info("💡 **Insight:** Los mejores clientes están en la esquina superior derecha (alta frecuencia + alto gasto)")
-
-    with tab2:
-        hover_data_tab2 = hover_base + ['Frecuencia']
-        fig_scatter2 = px.scatter(
-            df_rfm_seg,
-            x='Recencia',
-            y='Monetario',
-            color='Segmento',
-            size='Frecuencia',
-            hover_data=hover_data_tab2 if hover_data_tab2 else None,
-            title='Recencia vs Gasto Total (tamaño del punto = número de compras)',
-            labels={'Recencia': 'Días desde última compra', 'Monetario': 'Gasto Total (ARS)'},
-            color_discrete_sequence=px.colors.qualitative.Bold
-        )
-        fig_scatter2.update_layout(height=500)
-        st.plotly_chart(fig_scatter2, width='stretch')
-        st.info("💡 **Insight:** Los mejores clientes están en la esquina superior izquierda (compra reciente + alto gasto)")
-
-    with tab3:
-        hover_data_tab3 = hover_base + ['Monetario']
-        fig_scatter3 = px.scatter(
-            df_rfm_seg,
-            x='Recencia',
-            y='Frecuencia',
-            color='Segmento',
-            size='Monetario',
-            hover_data=hover_data_tab3 if hover_data_tab3 else None,
-            title='Recencia vs Frecuencia (tamaño del punto = gasto total)',
-            labels={'Recencia': 'Días desde última compra', 'Frecuencia': 'Número de Compras'},
-            color_discrete_sequence=px.colors.qualitative.Bold
-        )
-        fig_scatter3.update_layout(height=500)
-        st.plotly_chart(fig_scatter3, width='stretch')
-        st.info("💡 **Insight:** Los mejores clientes están en la esquina superior izquierda (compra reciente + alta frecuencia)")
-
-    # Top clientes
-    st.subheader("Top 15 Mejores Clientes")
-    
-    # Seleccionar solo columnas que existen
-    columnas_top = ['Recencia', 'Frecuencia', 'Monetario', 'Segmento']
-    if 'nombre_cliente' in df_rfm_seg.columns:
-        columnas_top.insert(0, 'nombre_cliente')
-    if 'ciudad' in df_rfm_seg.columns:
-        columnas_top.insert(1, 'ciudad')
-    
-    top_clientes = df_rfm_seg.nlargest(15, 'Monetario')[columnas_top]
-    top_clientes_display = top_clientes.copy()
-    top_clientes_display['Recencia'] = top_clientes_display['Recencia'].apply(lambda x: f"{x} días")
-    top_clientes_display['Frecuencia'] = top_clientes_display['Frecuencia'].apply(lambda x: f"{x} compras")
-    top_clientes_display['Monetario'] = top_clientes_display['Monetario'].apply(lambda x: f"ARS ${x:,.2f}")
-    
-    # Renombrar columnas dinámicamente
-    nuevos_nombres = {}
-    if 'nombre_cliente' in top_clientes_display.columns:
-        nuevos_nombres['nombre_cliente'] = 'Cliente'
-    if 'ciudad' in top_clientes_display.columns:
-        nuevos_nombres['ciudad'] = 'Ciudad'
-    nuevos_nombres.update({
-        'Recencia': 'Última Compra',
-        'Frecuencia': 'Total Compras',
-        'Monetario': 'Gasto Total',
-        'Segmento': 'Segmento'
+        mostrar_grafico(grafico_transacciones_ciudad(ciudad_stats))
+    
+    # Tabla resumen (el formato se aplica al renderizar y las columnas siguen siendo numéricas)
+    ciudad_stats_display = ciudad_stats.rename(columns={
+        'ciudad': 'Ciudad',
+        'ventas_totales': 'Ventas Totales',
+        'num_transacciones': 'Transacciones',
+        'unidades_vendidas': 'Unidades Vendidas',
+        'ticket_promedio': 'Ticket Promedio'
+    }).style.format({
+        'Ventas Totales': 'ARS ${:,.2f}',
+        'Ticket Promedio': 'ARS ${:,.2f}'
     })
-    top_clientes_display = top_clientes_display.rename(columns=nuevos_nombres)
+    st.dataframe(ciudad_stats_display, width='stretch', hide_index=True)
+    
+    st.markdown("---")
+    
+    # =============================
+    # SECCIÓN 4: ANÁLISIS DE PRODUCTOS
+    # =============================
+    st.header("Análisis de Productos")
+    
+    col1, col2 = st.columns(2)
     
-    st.dataframe(top_clientes_display, width='stretch', hide_index=True)
-
-st.markdown("---")
-
-# =============================
-# SECCIÓN 7: CORRELACIONES RFM
-# =============================
-col_header1, col_header2 = st.columns([10, 1])
-with col_header1:
-    st.header("Matriz de Correlación RFM")
-with col_header2:
-    st.markdown("")  # Espaciado
-    with st.popover("ℹ️"):
-        st.markdown("""
-        **¿Qué nos dice la correlación?**
-        - **Positiva (+)**: Cuando una métrica aumenta, la otra también
-        - **Negativa (-)**: Cuando una métrica aumenta, la otra disminuye
-        - **Cercana a 0**: No hay relación entre las métricas
-        
-        **Valores de referencia:**
-        - **0.7 a 1.0**: Correlación fuerte
-        - **0.3 a 0.7**: Correlación moderada
-        - **0.0 a 0.3**: Correlación débil
-        """)
-
-# Calcular correlaciones solo si hay datos RFM filtrados
-if len(df_rfm_filtrado) > 0:
-    corr_matrix = df_rfm_filtrado[['Recencia', 'Frecuencia', 'Monetario']].corr()
-
-    col1, col2 = st.columns([2, 1])
-
     with col1:
-        fig_corr = go.Figure(data=go.Heatmap(
-            z=corr_matrix.values,
-            x=corr_matrix.columns,
-            y=corr_matrix.columns,
-            colorscale='RdBu',
-            zmid=0,
-            text=corr_matrix.values,
-            texttemplate='%{text:.3f}',
-            textfont={"size": 16, "color": "white"},
-            colorbar=dict(title="Correlación")
-        ))
-        
-        fig_corr.update_layout(
-            title='Correlación entre Métricas RFM',
-            height=450,
-            xaxis_title="",
-            yaxis_title=""
-        )
-        
-        st.plotly_chart(fig_corr, width='stretch')
-
+        n_productos = st.slider("Top N Productos:", 5, 20, 10)
+    
     with col2:
-        # Interpretación automática
-        freq_mon_corr = corr_matrix.loc['Frecuencia', 'Monetario']
-        rec_freq_corr = corr_matrix.loc['Recencia', 'Frecuencia']
-        rec_mon_corr = corr_matrix.loc['Recencia', 'Monetario']
-        
-        st.markdown(f"""
-        **Frecuencia ↔ Monetario**  
-        Correlación: `{freq_mon_corr:.3f}`
-        """)
-        if freq_mon_corr > 0.5:
-            st.success("✅ Positiva: Clientes frecuentes gastan más")
-        elif freq_mon_corr > 0.3:
-            st.info("⚠️ Moderada: Cierta conexión entre frecuencia y gasto")
-        else:
-            st.warning("❌ Débil: Frecuencia no implica mayor gasto")
-        
-        st.markdown(f"""
-        **Recencia ↔ Frecuencia**  
-        Correlación: `{rec_freq_corr:.3f}`
-        """)
-        if rec_freq_corr < -0.3:
-            st.success("✅ Negativa: Clientes recientes son más frecuentes")
-        else:
-            st.info("⚠️ Relación débil entre recencia y frecuencia")
-        
-        st.markdown(f"""
-        **Recencia ↔ Monetario**  
-        Correlación: `{rec_mon_corr:.3f}`
-        """)
-        if rec_mon_corr < -0.3:
-            st.success("✅ Negativa: Clientes recientes gastan más")
-        else:
-            st.info("⚠️ Relación débil entre recencia y gasto")
-else:
-    st.warning("⚠️ No hay datos suficientes para calcular correlaciones RFM con los filtros aplicados.")
-
-st.markdown("---")
+        metrica_prod = st.selectbox("Ordenar por:", ["Ingresos", "Cantidad Vendida"])
+    
+    metrica = 'importe' if metrica_prod == "Ingresos" else 'cantidad'
+    top_prods = top_productos(df_filtrado, clave_filtros, n=n_productos, metrica=metrica)
+    
+    # Mostrar gráficos de productos en dos columnas
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        mostrar_grafico(grafico_top_productos(top_prods, metrica, metrica_prod, n_productos))
+    
+    with col2:
+        # Distribución por categoría con información detallada en hover
+        categoria_stats = df_filtrado.groupby('categoria', observed=True, sort=False, as_index=False).agg({
+            'importe': 'sum',
+            'id_venta': 'nunique'
+        })
+        categoria_stats.columns = ['categoria', 'ventas_totales', 'num_transacciones']
+        categoria_stats = categoria_stats.sort_values('ventas_totales', ascending=False)
+    
+        # Calcular métricas adicionales para el hover
+        categoria_stats['ticket_promedio'] = categoria_stats['ventas_totales'] / categoria_stats['num_transacciones']
+        categoria_stats['porcentaje'] = (categoria_stats['ventas_totales'] / categoria_stats['ventas_totales'].sum() * 100)
+    
+        mostrar_grafico(grafico_categorias(categoria_stats))
+    
+    st.markdown("---")
+    
+    # =============================
+    # SECCIÓN 5: ANÁLISIS DE MÉTODOS DE PAGO
+    # =============================
+    st.header("Análisis de Métodos de Pago")
+    
+    df_ventas_filtradas = filtrar_por_fechas(df_ventas, fecha_inicio, fecha_fin)
+    
+    # medio_pago es categórica: value_counts lista también los medios sin ventas con 0
+    metodo_pago_stats = df_ventas_filtradas['medio_pago'].value_counts()
+    metodo_pago_stats = metodo_pago_stats[metodo_pago_stats > 0].reset_index()
+    metodo_pago_stats.columns = ['medio_pago', 'cantidad']
+    
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        mostrar_grafico(grafico_metodos_pago(metodo_pago_stats))
+    
+    with col2:
+        # Método de pago por ciudad (top 3 ciudades)
+        top_3_ciudades = ciudad_stats.head(3)['ciudad'].tolist()
+        df_pago_ciudad = df_filtrado[df_filtrado['ciudad'].isin(top_3_ciudades)]
+    
+        pago_ciudad_stats = df_pago_ciudad[['ciudad', 'medio_pago']].value_counts().rename('count').reset_index()
+    
+        mostrar_grafico(grafico_pago_ciudad(pago_ciudad_stats))
+    
+    st.markdown("---")
+    
+    # =============================
+    # SECCIÓN 6: SEGMENTACIÓN RFM
+    # =============================
+    col_header1, col_header2 = st.columns([10, 1])
+    with col_header1:
+        st.header("Análisis RFM")
+    with col_header2:
+        st.markdown("")  # Espaciado
+        with st.popover("ℹ️"):
+            st.markdown("""
+            **¿Qué es RFM?**
+    
+            **Recency (Recencia)**: Días desde la última compra
+            - ✅ Menor = Mejor (compró recientemente)
+            - ❌ Mayor = Peor (hace tiempo que no compra)
+    
+            **Frequency (Frecuencia)**: Número de compras
+            - ✅ Mayor = Mejor (cliente frecuente)
+            - ❌ Menor = Peor (compra poco)
+    
+            **Monetary (Monetario)**: Gasto total
+            - ✅ Mayor = Mejor (cliente valioso)
+            - ❌ Menor = Peor (gasta poco)
+    
+            **Segmentos de clientes:**
+            - **Campeones**: Los mejores clientes
+            - **Leales**: Clientes constantes
+            - **Potenciales**: Pueden mejorar
+            - **En Riesgo**: Requieren atención
+            - **Inactivos**: No compran hace tiempo
+            """)
+    
+    # Calcular RFM basado en datos filtrados
+    df_rfm_filtrado = calcular_rfm_filtrado(df_filtrado, clave_filtros)
+    
+    # Validar que hay datos
+    if len(df_rfm_filtrado) == 0:
+        st.warning("⚠️ No hay datos suficientes para calcular el análisis RFM con los filtros aplicados.")
+    else:
+        df_rfm_seg = segmentacion_rfm(df_rfm_filtrado, clave_filtros)
+    
+        # KPIs RFM
+        st.subheader("Métricas generales")
+        col1, col2, col3 = st.columns(3)
+    
+        with col1:
+            st.metric(
+                label="🕐 Recencia Promedio",
+                value=f"{df_rfm_filtrado['Recencia'].mean():.0f} días",
+                delta=f"Min: {df_rfm_filtrado['Recencia'].min()} días",
+                delta_color="inverse"  # Menor es mejor
+            )
+    
+        with col2:
+            st.metric(
+                label="🔄 Frecuencia Promedio",
+                value=f"{df_rfm_filtrado['Frecuencia'].mean():.1f} compras",
+                delta=f"Max: {df_rfm_filtrado['Frecuencia'].max()} compras"
+            )
+    
+        with col3:
+            st.metric(
+                label="💰 Gasto Promedio",
+                value=f"ARS ${df_rfm_filtrado['Monetario'].mean():,.2f}",
+                delta=f"Total: ARS ${df_rfm_filtrado['Monetario'].sum():,.0f}"
+            )
+    
+    
+        # Calcular métricas por segmento
+        segmento_metricas = metricas_por_segmento(df_rfm_seg, clave_filtros)
+    
+        mostrar_grafico(grafico_segmentos(segmento_metricas))
+    
+        # Tabla detallada de segmentos
+        segmento_metricas_display = segmento_metricas[['Segmento', 'Cantidad Clientes', 'Porcentaje', 'Recencia Promedio', 'Frecuencia Promedio', 'Gasto Promedio']].style.format({
+            'Porcentaje': '{:.1f}%',
+            'Recencia Promedio': '{:.0f} días',
+            'Frecuencia Promedio': '{:.1f} compras',
+            'Gasto Promedio': 'ARS ${:,.2f}'
+        })
+        st.dataframe(segmento_metricas_display, width='stretch', hide_index=True)
+    
+        # Gráficos de distribución RFM - Box plots con violin para mejor visualización
+        col_header1, col_header2 = st.columns([10, 1])
+        with col_header1:
+            st.subheader("Distribuciones de métricas RFM por Segmento")
+        with col_header2:
+            st.markdown("")  # Espaciado
+            with st.popover("ℹ️"):
+                st.markdown("""
+                **¿Cómo leer estos gráficos?**
+    
+                Cada figura combina dos visualizaciones:
+    
+                **Forma de violín:**
+                - Muestra la distribución completa de los datos
+                - La parte más ancha indica mayor concentración de clientes
+                - Te permite ver la "forma" de tus datos
+    
+                **Box plot interno (caja):**
+                - La línea central es la **mediana** (50% de los datos)
+                - Los bordes de la caja son **Q1 y Q3** (25% y 75%)
+                - Los bigotes muestran el rango de datos
+                - Los puntos son **outliers** (valores atípicos)
+    
+                Pasa el mouse sobre el gráfico para ver estadísticos detallados.
+                """)
+    
+        col1, col2, col3 = st.columns(3)
+    
+        with col1:
+            mostrar_grafico(grafico_violin_segmentos(df_rfm_seg['Segmento'], df_rfm_seg['Recencia'], 'Distribución de Recencia', 'Días desde última compra'))
+    
+        with col2:
+            mostrar_grafico(grafico_violin_segmentos(df_rfm_seg['Segmento'], df_rfm_seg['Frecuencia'], 'Distribución de Frecuencia', 'Número de compras'))
+    
+        with col3:
+            mostrar_grafico(grafico_violin_segmentos(df_rfm_seg['Segmento'], df_rfm_seg['Monetario'], 'Distribución de Gasto', 'Gasto Total (ARS)'))
+    
+        # Scatter plots RFM mejorados
+        st.subheader("Análisis de Relaciones entre Métricas RFM")
+    
+        tab1, tab2, tab3 = st.tabs(["Frecuencia vs Monetario", "Recencia vs Monetario", "Recencia vs Frecuencia"])
+    
+        # Preparar hover_data - incluir nombre_cliente y ciudad si existen
+        hover_base = []
+        if 'nombre_cliente' in df_rfm_seg.columns:
+            hover_base.append('nombre_cliente')
+        if 'ciudad' in df_rfm_seg.columns:
+            hover_base.append('ciudad')
+    
+        with tab1:
+            mostrar_grafico(grafico_dispersion_rfm(
+                df_rfm_seg,
+                clave_filtros,
+                x='Frecuencia',
+                y='Monetario',
+                tamanio='Recencia',
+                hover_data=hover_base + ['Recencia'],
+                titulo='Frecuencia vs Gasto Total (tamaño del punto = días desde última compra)',
+                etiquetas={'Frecuencia': 'Número de Compras', 'Monetario': 'Gasto Total (ARS)'}
+            ))
+            st.info("💡 **Insight:** Los mejores clientes están en la esquina superior derecha (alta frecuencia + alto gasto)")
+    
+        with tab2:
+            mostrar_grafico(grafico_dispersion_rfm(
+                df_rfm_seg,
+                clave_filtros,
+                x='Recencia',
+                y='Monetario',
+                tamanio='Frecuencia',
+                hover_data=hover_base + ['Frecuencia'],
+                titulo='Recencia vs Gasto Total (tamaño del punto = número de compras)',
+                etiquetas={'Recencia': 'Días desde última compra', 'Monetario': 'Gasto Total (ARS)'}
+            ))
+            st.info("💡 **Insight:** Los mejores clientes están en la esquina superior izquierda (compra reciente + alto gasto)")
+    
+        with tab3:
+            mostrar_grafico(grafico_dispersion_rfm(
+                df_rfm_seg,
+                clave_filtros,
+                x='Recencia',
+                y='Frecuencia',
+                tamanio='Monetario',
+                hover_data=hover_base + ['Monetario'],
+                titulo='Recencia vs Frecuencia (tamaño del punto = gasto total)',
+                etiquetas={'Recencia': 'Días desde última compra', 'Frecuencia': 'Número de Compras'}
+            ))
+            st.info("💡 **Insight:** Los mejores clientes están en la esquina superior izquierda (compra reciente + alta frecuencia)")
+    
+        # Top clientes
+        st.subheader("Top 15 Mejores Clientes")
+    
+        # Seleccionar solo columnas que existen
+        columnas_top = ['Recencia', 'Frecuencia', 'Monetario', 'Segmento']
+        if 'nombre_cliente' in df_rfm_seg.columns:
+            columnas_top.insert(0, 'nombre_cliente')
+        if 'ciudad' in df_rfm_seg.columns:
+            columnas_top.insert(1, 'ciudad')
+    
+        top_clientes = top_clientes_rfm(df_rfm_seg, clave_filtros, columnas_top)
+    
+        # Renombrar columnas dinámicamente
+        nuevos_nombres = {}
+        if 'nombre_cliente' in top_clientes.columns:
+            nuevos_nombres['nombre_cliente'] = 'Cliente'
+        if 'ciudad' in top_clientes.columns:
+            nuevos_nombres['ciudad'] = 'Ciudad'
+        nuevos_nombres.update({
+            'Recencia': 'Última Compra',
+            'Frecuencia': 'Total Compras',
+            'Monetario': 'Gasto Total',
+            'Segmento': 'Segmento'
+        })
+        top_clientes_display = top_clientes.rename(columns=nuevos_nombres).style.format({
+            'Última Compra': '{} días',
+            'Total Compras': '{} compras',
+            'Gasto Total': 'ARS ${:,.2f}'
+        })
+    
+        st.dataframe(top_clientes_display, width='stretch', hide_index=True)
+    
+    st.markdown("---")
+    
+    # =============================
+    # SECCIÓN 7: CORRELACIONES RFM
+    # =============================
+    col_header1, col_header2 = st.columns([10, 1])
+    with col_header1:
+        st.header("Matriz de Correlación RFM")
+    with col_header2:
+        st.markdown("")  # Espaciado
+        with st.popover("ℹ️"):
+            st.markdown("""
+            **¿Qué nos dice la correlación?**
+            - **Positiva (+)**: Cuando una métrica aumenta, la otra también
+            - **Negativa (-)**: Cuando una métrica aumenta, la otra disminuye
+            - **Cercana a 0**: No hay relación entre las métricas
+    
+            **Valores de referencia:**
+            - **0.7 a 1.0**: Correlación fuerte
+            - **0.3 a 0.7**: Correlación moderada
+            - **0.0 a 0.3**: Correlación débil
+            """)
+    
+    # Calcular correlaciones solo si hay datos RFM filtrados
+    if len(df_rfm_filtrado) > 0:
+        corr_matrix = correlaciones_rfm(df_rfm_filtrado, clave_filtros)
+    
+        col1, col2 = st.columns([2, 1])
+    
+        with col1:
+            fig_corr = go.Figure(data=go.Heatmap(
+                z=corr_matrix.values,
+                x=corr_matrix.columns,
+                y=corr_matrix.columns,
+                colorscale='RdBu',
+                zmid=0,
+                text=corr_matrix.values,
+                texttemplate='%{text:.3f}',
+                textfont={"size": 16, "color": "white"},
+                colorbar=dict(title="Correlación")
+            ))
+    
+            fig_corr.update_layout(
+                title='Correlación entre Métricas RFM',
+                height=450,
+                xaxis_title="",
+                yaxis_title=""
+            )
+    
+            st.plotly_chart(fig_corr, width='stretch')
+    
+        with col2:
+            # Interpretación automática
+            freq_mon_corr = corr_matrix.loc['Frecuencia', 'Monetario']
+            rec_freq_corr = corr_matrix.loc['Recencia', 'Frecuencia']
+            rec_mon_corr = corr_matrix.loc['Recencia', 'Monetario']
+    
+            st.markdown(f"""
+            **Frecuencia ↔ Monetario**  
+            Correlación: `{freq_mon_corr:.3f}`
+            """)
+            if freq_mon_corr > 0.5:
+                st.success("✅ Positiva: Clientes frecuentes gastan más")
+            elif freq_mon_corr > 0.3:
+                st.info("⚠️ Moderada: Cierta conexión entre frecuencia y gasto")
+            else:
+                st.warning("❌ Débil: Frecuencia no implica mayor gasto")
+    
+            st.markdown(f"""
+            **Recencia ↔ Frecuencia**  
+            Correlación: `{rec_freq_corr:.3f}`
+            """)
+            if rec_freq_corr < -0.3:
+                st.success("✅ Negativa: Clientes recientes son más frecuentes")
+            else:
+                st.info("⚠️ Relación débil entre recencia y frecuencia")
+    
+            st.markdown(f"""
+            **Recencia ↔ Monetario**  
+            Correlación: `{rec_mon_corr:.3f}`
+            """)
+            if rec_mon_corr < -0.3:
+                st.success("✅ Negativa: Clientes recientes gastan más")
+            else:
+                st.info("⚠️ Relación débil entre recencia y gasto")
+    else:
+        st.warning("⚠️ No hay datos suficientes para calcular correlaciones RFM con los filtros aplicados.")
+    
+    st.markdown("---")
 
 # =============================
 # SECCIÓN 8: ANÁLISIS TEMPORAL
@@ -1030,34 +1229,28 @@ with col_header2:
 tab1, tab2, tab3 = st.tabs(["Tendencias por Categoría", "Estacionalidad", "Exportar Datos"])
 
 with tab1:
-    # Ventas por mes y categoría
-    df_tiempo_cat = df_filtrado.copy()
-    df_tiempo_cat['mes'] = df_tiempo_cat['fecha'].dt.to_period('M').astype(str)
-    
-    ventas_mes_cat = df_tiempo_cat.groupby(['mes', 'categoria'])['importe'].sum().reset_index()
-    
-    fig_trend = px.line(
-        ventas_mes_cat,
-        x='mes',
-        y='importe',
-        color='categoria',
-        title='Evolución de Ventas por Categoría (ARS)',
-        labels={'importe': 'Ventas (ARS)', 'mes': 'Mes', 'categoria': 'Categoría'},
-        markers=True
-    )
-    fig_trend.update_layout(height=450, hovermode='x unified')
-    st.plotly_chart(fig_trend, width='stretch')
-    
-    # Identificar categoría con mayor crecimiento
-    if len(ventas_mes_cat) > 0:
-        primera_mitad = ventas_mes_cat.groupby('categoria')['importe'].apply(lambda x: x.iloc[:len(x)//2].sum() if len(x) > 1 else x.sum())
-        segunda_mitad = ventas_mes_cat.groupby('categoria')['importe'].apply(lambda x: x.iloc[len(x)//2:].sum() if len(x) > 1 else 0)
-        crecimiento = ((segunda_mitad - primera_mitad) / primera_mitad * 100).sort_values(ascending=False)
+    if hay_ventas:
+        # Ventas por mes y categoría
+        ventas_mes_cat, crecimiento = tendencias_por_categoria(df_filtrado, clave_filtros)
+        
+        fig_trend = px.line(
+            ventas_mes_cat,
+            x='mes',
+            y='importe',
+            color='categoria',
+            title='Evolución de Ventas por Categoría (ARS)',
+            labels={'importe': 'Ventas (ARS)', 'mes': 'Mes', 'categoria': 'Categoría'},
+            markers=True
+        )
+        fig_trend.update_layout(height=450, hovermode='x unified')
+        fig_trend.update_xaxes(tickformat='%Y-%m', hoverformat='%Y-%m')
+        st.plotly_chart(fig_trend, width='stretch')
         
+        # Identificar categoría con mayor crecimiento
         if len(crecimiento) > 0:
             mejor_categoria = crecimiento.idxmax()
             peor_categoria = crecimiento.idxmin()
-            
+        
             st.markdown(f"""
             <div class="insight-box">
                 <strong>💡 Insights de Tendencias:</strong><br>
@@ -1067,109 +1260,82 @@ with tab1:
             """, unsafe_allow_html=True)
 
 with tab2:
-    col1, col2 = st.columns(2)
-    
-    with col1:
-        # Análisis por día de la semana
-        df_estacional = df_filtrado.copy()
-        df_estacional['dia_semana'] = df_estacional['fecha'].dt.day_name()
+    if hay_ventas:
+        df_fechas = caracteristicas_fecha(df_filtrado, clave_filtros)
+        col1, col2 = st.columns(2)
         
-        dias_esp = {
-            'Monday': 'Lunes',
-            'Tuesday': 'Martes', 
-            'Wednesday': 'Miércoles',
-            'Thursday': 'Jueves',
-            'Friday': 'Viernes',
-            'Saturday': 'Sábado',
-            'Sunday': 'Domingo'
-        }
+        with col1:
+            # Análisis por día de la semana
+            # Los días sin ventas quedan en NaN: aparecen en el eje pero no cuentan como mejor o menor día
+            ventas_dia = df_fechas.groupby('dia_semana_esp', observed=False)['importe'].sum(min_count=1).reset_index()
         
-        orden_dias = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
-        ventas_dia = df_estacional.groupby('dia_semana')['importe'].sum().reindex(orden_dias).reset_index()
-        ventas_dia['dia_semana_esp'] = ventas_dia['dia_semana'].map(dias_esp)
+            fig_estacional = px.bar(
+                ventas_dia,
+                x='dia_semana_esp',
+                y='importe',
+                title='Ventas por Día de la Semana',
+                labels={'importe': 'Ventas (ARS)', 'dia_semana_esp': 'Día'},
+                color='importe',
+                color_continuous_scale='Turbo',
+                text='importe'
+            )
+            fig_estacional.update_traces(texttemplate='$%{text:,.0f}', textposition='inside')
+            fig_estacional.update_layout(height=400, showlegend=False)
+            st.plotly_chart(fig_estacional, width='stretch')
         
-        fig_estacional = px.bar(
-            ventas_dia,
-            x='dia_semana_esp',
-            y='importe',
-            title='Ventas por Día de la Semana',
-            labels={'importe': 'Ventas (ARS)', 'dia_semana_esp': 'Día'},
-            color='importe',
-            color_continuous_scale='Turbo',
-            text='importe'
-        )
-        fig_estacional.update_traces(texttemplate='$%{text:,.0f}', textposition='inside')
-        fig_estacional.update_layout(height=400, showlegend=False)
-        st.plotly_chart(fig_estacional, width='stretch')
+            mejor_dia = ventas_dia.loc[ventas_dia['importe'].idxmax(), 'dia_semana_esp']
+            peor_dia = ventas_dia.loc[ventas_dia['importe'].idxmin(), 'dia_semana_esp']
+            st.info(f"📅 **Mejor día:** {mejor_dia} | **Menor día:** {peor_dia}")
         
-        mejor_dia = ventas_dia.loc[ventas_dia['importe'].idxmax(), 'dia_semana_esp']
-        peor_dia = ventas_dia.loc[ventas_dia['importe'].idxmin(), 'dia_semana_esp']
-        st.info(f"📅 **Mejor día:** {mejor_dia} | **Menor día:** {peor_dia}")
-    
-    with col2:
-        # Análisis por hora (si hay datos de hora)
-        df_mes = df_filtrado.copy()
-        df_mes['mes_num'] = df_mes['fecha'].dt.month
+        with col2:
+            # Análisis por hora (si hay datos de hora)
+            ventas_mes = df_fechas.groupby('mes_nombre', observed=True)['importe'].sum().reset_index()
         
-        meses_esp = {
-            1: 'Enero', 2: 'Febrero', 3: 'Marzo', 4: 'Abril',
-            5: 'Mayo', 6: 'Junio', 7: 'Julio', 8: 'Agosto',
-            9: 'Septiembre', 10: 'Octubre', 11: 'Noviembre', 12: 'Diciembre'
-        }
+            fig_mes = px.bar(
+                ventas_mes,
+                x='mes_nombre',
+                y='importe',
+                title='Ventas por Mes',
+                labels={'importe': 'Ventas (ARS)', 'mes_nombre': 'Mes'},
+                color='importe',
+                color_continuous_scale='Viridis',
+                text='importe'
+            )
+            fig_mes.update_traces(texttemplate='$%{text:,.0f}', textposition='inside')
+            fig_mes.update_layout(height=400, showlegend=False)
+            st.plotly_chart(fig_mes, width='stretch')
         
-        ventas_mes = df_mes.groupby('mes_num')['importe'].sum().reset_index()
-        ventas_mes['mes_nombre'] = ventas_mes['mes_num'].map(meses_esp)
+            mejor_mes = ventas_mes.loc[ventas_mes['importe'].idxmax(), 'mes_nombre']
+            peor_mes = ventas_mes.loc[ventas_mes['importe'].idxmin(), 'mes_nombre']
+            st.info(f"📆 **Mejor mes:** {mejor_mes} | **Menor mes:** {peor_mes}")
         
-        fig_mes = px.bar(
-            ventas_mes,
-            x='mes_nombre',
-            y='importe',
-            title='Ventas por Mes',
-            labels={'importe': 'Ventas (ARS)', 'mes_nombre': 'Mes'},
-            color='importe',
-            color_continuous_scale='Viridis',
-            text='importe'
+        # Heatmap de ventas por día y mes
+        ventas_pivot = ventas_mes_dia(df_filtrado, clave_filtros)
+        
+        fig_heat = go.Figure(data=go.Heatmap(
+            z=ventas_pivot.values,
+            x=ventas_pivot.columns,
+            y=MESES.categories[ventas_pivot.index - 1],
+            colorscale='YlOrRd',
+            colorbar=dict(title="Ventas (ARS)")
+        ))
+        
+        fig_heat.update_layout(
+            title='Mapa de Calor: Ventas por Mes y Día',
+            xaxis_title='Día del Mes',
+            yaxis_title='Mes',
+            height=400
         )
-        fig_mes.update_traces(texttemplate='$%{text:,.0f}', textposition='inside')
-        fig_mes.update_layout(height=400, showlegend=False)
-        st.plotly_chart(fig_mes, width='stretch')
+        st.plotly_chart(fig_heat, width='stretch')
         
-        mejor_mes = ventas_mes.loc[ventas_mes['importe'].idxmax(), 'mes_nombre']
-        peor_mes = ventas_mes.loc[ventas_mes['importe'].idxmin(), 'mes_nombre']
-        st.info(f"📆 **Mejor mes:** {mejor_mes} | **Menor mes:** {peor_mes}")
-    
-    # Heatmap de ventas por día y mes
-    df_heatmap = df_filtrado.copy()
-    df_heatmap['mes'] = df_heatmap['fecha'].dt.month
-    df_heatmap['dia'] = df_heatmap['fecha'].dt.day
-    
-    ventas_heatmap = df_heatmap.groupby(['mes', 'dia'])['importe'].sum().reset_index()
-    ventas_pivot = ventas_heatmap.pivot(index='mes', columns='dia', values='importe').fillna(0)
-    
-    fig_heat = go.Figure(data=go.Heatmap(
-        z=ventas_pivot.values,
-        x=ventas_pivot.columns,
-        y=[meses_esp.get(i, i) for i in ventas_pivot.index],
-        colorscale='YlOrRd',
-        colorbar=dict(title="Ventas (ARS)")
-    ))
-    
-    fig_heat.update_layout(
-        title='Mapa de Calor: Ventas por Mes y Día',
-        xaxis_title='Día del Mes',
-        yaxis_title='Mes',
-        height=400
-    )
-    st.plotly_chart(fig_heat, width='stretch')
-    
-    st.markdown("""
-    <div class="insight-box">
-        <strong>🔍 Cómo interpretar el mapa de calor:</strong><br>
-        • <strong>Colores más intensos (rojo):</strong> Días con mayores ventas<br>
-        • <strong>Colores más claros (amarillo):</strong> Días con menores ventas<br>
-        • Identifica patrones: ¿hay días del mes que siempre venden más?
-    </div>
-    """, unsafe_allow_html=True)
+        st.markdown("""
+        <div class="insight-box">
+            <strong>🔍 Cómo interpretar el mapa de calor:</strong><br>
+            • <strong>Colores más intensos (rojo):</strong> Días con mayores ventas<br>
+            • <strong>Colores más claros (amarillo):</strong> Días con menores ventas<br>
+            • Identifica patrones: ¿hay días del mes que siempre venden más?
+        </div>
+        """, unsafe_allow_html=True)
 
 with tab3:
     st.markdown("**Descarga los datos procesados para análisis adicional en Excel, Power BI, u otras herramientas**")
@@ -1211,28 +1377,27 @@ with tab3:
         st.markdown(f"**Preview** (primeras 100 filas de {len(df_detalle):,} totales)")
         st.dataframe(df_detalle.head(100), width='stretch')
     
-    # Botones de descarga
+    # Botones de descarga (las tablas filtradas cambian con los filtros; el resto es fijo)
+    if tabla_seleccion in ("Datos Consolidados (Filtrados)", "RFM Segmentado"):
+        clave_exportacion = (tabla_seleccion, clave_filtros)
+    else:
+        clave_exportacion = (tabla_seleccion, None)
+    
     if formato == "CSV":
         st.download_button(
             label="📥 Descargar CSV",
-            data=data_to_export.to_csv(index=False).encode('utf-8'),
+            data=exportar_csv(data_to_export, clave_exportacion),
             file_name=f'{tabla_seleccion.lower().replace(" ", "_")}.csv',
             mime='text/csv',
             width='stretch'
         )
-    else:
-        # Para Excel necesitamos usar BytesIO
-        from io import BytesIO
-        output = BytesIO()
-        with pd.ExcelWriter(output, engine='openpyxl') as writer:
-            data_to_export.to_excel(writer, index=False, sheet_name='Datos')
-        excel_data = output.getvalue()
-        
+    elif st.button("📄 Preparar Excel", width='stretch'):
         st.download_button(
             label="📥 Descargar Excel",
-            data=excel_data,
+            data=exportar_excel(data_to_export, clave_exportacion),
             file_name=f'{tabla_seleccion.lower().replace(" ", "_")}.xlsx',
             mime='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+            on_click='ignore',
             width='stretch'
         )
     
@@ -1339,7 +1504,7 @@ try:
     st.subheader("Distribución de Clientes por Segmento")
     
     # Calcular distribución
-    dist_clusters = df_clustering_full.groupby('cluster_nombre').agg({
+    dist_clusters = df_clustering_full.groupby('cluster_nombre', sort=False).agg({
         'id_cliente': 'count',
         'monetary': 'sum',
         'frequency': 'sum'
@@ -1586,15 +1751,16 @@ try:
     # =============================
     st.subheader("Perfiles por Segmento")
     
-    # Selector de cluster
-    clusters_disponibles = sorted(df_clustering_full['cluster_nombre'].unique())
+    # Selector de cluster (posiciones de cada cluster calculadas una sola vez)
+    filas_por_cluster = df_clustering_full.groupby('cluster_nombre', sort=False).indices
+    clusters_disponibles = sorted(filas_por_cluster)
     cluster_seleccionado = st.selectbox(
         "Selecciona un segmento para ver su detalle:",
         clusters_disponibles
     )
     
     # Filtrar datos del cluster seleccionado
-    cluster_data = df_clustering_full[df_clustering_full['cluster_nombre'] == cluster_seleccionado]
+    cluster_data = df_clustering_full.iloc[filas_por_cluster[cluster_seleccionado]]
     cluster_profile = df_profiles[df_profiles['cluster_nombre'] == cluster_seleccionado].iloc[0]
     
     # Métricas del cluster